@@ -0,0 +1,251 @@
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+import librosa
+import numpy as np
+import soundfile
+import soxr
+from numba import njit
+
+# Sample rates used for analysis
+ANALYSIS_SR = 22050
+YAMNET_SR = 16000
+
+# Formats libsndfile decodes natively; everything else goes through librosa
+SOUNDFILE_EXTENSIONS = {'.wav', '.flac', '.ogg'}
+
+# STFT shared by key and mood detection
+STFT_N_FFT = 4096
+STFT_HOP_LENGTH = 2048
+
+# Key and tempo are stationary enough to estimate from the start of a track
+KEY_SEGMENT_SECONDS = 30
+KEY_HOP_LENGTH = 4096
+BPM_SEGMENT_SECONDS = 60
+ONSET_HOP_LENGTH = 512
+
+# Fraction of spectral energy below the rolloff frequency
+ROLLOFF_PERCENT = 0.85
+
+# RMS framing matches librosa.feature.rms defaults (centred, zero-padded)
+RMS_FRAME_LENGTH = 2048
+RMS_HOP_LENGTH = 512
+
+# Sign bits of int16 lanes 1-3 in a packed uint64 (lane 0 has no in-word predecessor)
+ZCR_LANE_SIGN_MASK = np.uint64(0x8000800080000000)
+
+# Audio Analysis Functions
+def load_audio(path: str, target_sr: Optional[int] = None) -> tuple:
+    """Load audio as mono float32, resampling to target_sr if given"""
+    if Path(path).suffix.lower() in SOUNDFILE_EXTENSIONS:
+        try:
+            data, sr = soundfile.read(path, dtype='float32', always_2d=False)
+            if data.ndim > 1:
+                data = data.mean(axis=1)
+            if target_sr and sr != target_sr:
+                data = soxr.resample(data, sr, target_sr)
+                sr = target_sr
+            return data, sr
+        except Exception as e:
+            logging.warning(f"soundfile could not read {path}, falling back to librosa: {e}")
+    
+    return librosa.load(path, sr=target_sr, mono=True)
+
+def detect_bpm(y: np.ndarray, sr: int) -> float:
+    """Detect BPM using librosa"""
+    try:
+        y_head = y[:int(BPM_SEGMENT_SECONDS * sr)]
+        
+        # Tempo straight from the onset envelope; no beat-tracking DP needed for a scalar BPM
+        onset_env = librosa.onset.onset_strength(y=y_head, sr=sr, hop_length=ONSET_HOP_LENGTH, aggregate=np.median)
+        tempo = librosa.feature.tempo(onset_envelope=onset_env, sr=sr, hop_length=ONSET_HOP_LENGTH)[0]
+        return float(tempo)
+    except Exception as e:
+        logging.error(f"Error detecting BPM: {e}")
+        return 120.0  # Default BPM
+
+# Key mapping
+KEY_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Krumhansl-Schmuckler key profiles
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+def build_profile_matrix(profile: np.ndarray) -> np.ndarray:
+    """Stack all 12 rotations of a key profile as mean-centered, unit-norm rows"""
+    matrix = np.stack([np.roll(profile, i) for i in range(12)])
+    matrix = matrix - matrix.mean(axis=1, keepdims=True)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+MAJOR_MATRIX = build_profile_matrix(MAJOR_PROFILE)
+MINOR_MATRIX = build_profile_matrix(MINOR_PROFILE)
+
+def compute_spectrogram(y: np.ndarray) -> np.ndarray:
+    """Compute the STFT magnitude shared by the spectral detectors"""
+    return np.abs(librosa.stft(y, n_fft=STFT_N_FFT, hop_length=STFT_HOP_LENGTH))
+
+def detect_key(y: np.ndarray, sr: int, S: Optional[np.ndarray] = None) -> str:
+    """Detect musical key using librosa chroma features"""
+    try:
+        head_samples = int(KEY_SEGMENT_SECONDS * sr)
+        if S is None:
+            S = compute_spectrogram(y[:head_samples])
+        
+        # Keep the head segment, one frame every KEY_HOP_LENGTH samples
+        n_head_frames = 1 + head_samples // STFT_HOP_LENGTH
+        S_head = S[:, :n_head_frames:KEY_HOP_LENGTH // STFT_HOP_LENGTH]
+        chromagram = librosa.feature.chroma_stft(
+            S=S_head**2, sr=sr, n_fft=STFT_N_FFT, hop_length=KEY_HOP_LENGTH, tuning=0
+        )
+        chroma_mean = np.mean(chromagram, axis=1)
+        
+        # Correlate against all 24 key profiles in one matvec
+        c = chroma_mean - chroma_mean.mean()
+        scores = np.concatenate([MAJOR_MATRIX @ c, MINOR_MATRIX @ c])
+        best = int(np.argmax(scores))
+        
+        scale = "major" if best < 12 else "minor"
+        return f"{KEY_NAMES[best % 12]} {scale}"
+    except Exception as e:
+        logging.error(f"Error detecting key: {e}")
+        return "C major"  # Default key
+
+@njit(cache=True, fastmath=True)
+def analyze_spectrogram(S_frames, freqs, y, frame_length, hop_length, roll_percent):
+    """Mean spectral centroid, rolloff and RMS in one pass.
+    
+    S_frames is the STFT magnitude laid out as (n_frames, n_bins). RMS uses
+    centred, zero-padded frames of y like librosa.feature.rms. Serial on
+    purpose: it already runs in one of many DSP pool workers.
+    """
+    n_frames, n_bins = S_frames.shape
+    centroid = np.zeros(n_frames)
+    rolloff = np.zeros(n_frames)
+    for t in range(n_frames):
+        total = 0.0
+        weighted = 0.0
+        for f in range(n_bins):
+            total += S_frames[t, f]
+            weighted += freqs[f] * S_frames[t, f]
+        if total > 0:
+            centroid[t] = weighted / total
+            threshold = roll_percent * total
+            cumulative = 0.0
+            for f in range(n_bins):
+                cumulative += S_frames[t, f]
+                if cumulative >= threshold:
+                    rolloff[t] = freqs[f]
+                    break
+    
+    n_samples = len(y)
+    n_rms = 1 + n_samples // hop_length
+    rms = np.zeros(n_rms)
+    for i in range(n_rms):
+        # Padding samples are zero, so only the in-range part contributes energy
+        start = max(i * hop_length - frame_length // 2, 0)
+        end = min(i * hop_length + frame_length // 2, n_samples)
+        energy = 0.0
+        for j in range(start, end):
+            energy += y[j] * y[j]
+        rms[i] = np.sqrt(energy / frame_length)
+    
+    return centroid.mean(), rolloff.mean(), rms.mean()
+
+@njit(cache=True)
+def mean_zcr_int16(pcm):
+    """Mean zero-crossing rate of int16 PCM, four samples per uint64 word.
+    
+    Zero counts as positive, matching librosa.zero_crossings.
+    """
+    n_samples = len(pcm)
+    if n_samples < 2:
+        return 0.0
+    
+    n_words = n_samples // 4
+    words = pcm[:n_words * 4].view(np.uint64)
+    one = np.uint64(1)
+    three = np.uint64(3)
+    crossings = np.uint64(0)
+    for w in range(n_words):
+        x = words[w]
+        # Sign changes between adjacent lanes land on bits 31, 47 and 63
+        v = ((x ^ (x << np.uint64(16))) & ZCR_LANE_SIGN_MASK) >> np.uint64(31)
+        crossings += (v + (v >> np.uint64(16)) + (v >> np.uint64(32))) & three
+    
+    # Pairs that straddle word boundaries
+    for w in range(1, n_words):
+        crossings += (words[w - 1] >> np.uint64(63)) ^ ((words[w] >> np.uint64(15)) & one)
+    
+    # Samples after the last full word
+    for i in range(max(n_words * 4, 1), n_samples):
+        if (pcm[i] < 0) != (pcm[i - 1] < 0):
+            crossings += one
+    
+    return crossings / n_samples
+
+def detect_mood(y: np.ndarray, sr: int, S: Optional[np.ndarray] = None) -> List[str]:
+    """Detect mood tags using spectral features"""
+    try:
+        if S is None:
+            S = compute_spectrogram(y)
+        
+        # Extract features
+        freqs = librosa.fft_frequencies(sr=sr, n_fft=STFT_N_FFT)
+        spectral_centroid, spectral_rolloff, rms = analyze_spectrogram(
+            np.ascontiguousarray(S.T), freqs, y, RMS_FRAME_LENGTH, RMS_HOP_LENGTH, ROLLOFF_PERCENT
+        )
+        pcm = (np.clip(y, -1.0, 1.0) * 32767).astype(np.int16)
+        zero_crossing_rate = mean_zcr_int16(pcm)
+        
+        moods = []
+        
+        # Brightness
+        if spectral_centroid > 2000:
+            moods.append("bright")
+        elif spectral_centroid < 1000:
+            moods.append("dark")
+        
+        # Energy
+        if rms > 0.1:
+            moods.append("energetic")
+        elif rms < 0.05:
+            moods.append("calm")
+        
+        # Texture
+        if zero_crossing_rate > 0.15:
+            moods.append("aggressive")
+        elif zero_crossing_rate < 0.05:
+            moods.append("smooth")
+        
+        # Additional mood tags based on spectral rolloff
+        if spectral_rolloff > 4000:
+            moods.append("sharp")
+        else:
+            moods.append("warm")
+        
+        return moods if moods else ["neutral"]
+    except Exception as e:
+        logging.error(f"Error detecting mood: {e}")
+        return ["neutral"]
+
+def analyze_dsp(tmp_path: str, want_16k: bool) -> dict:
+    """Decode audio and run the librosa detectors; runs in the server's DSP process pool"""
+    # Decode once; every detector works from the same samples
+    y, sr = load_audio(tmp_path, ANALYSIS_SR)
+    
+    # YAMNet needs 16 kHz input
+    y16k = None
+    if want_16k:
+        y16k = soxr.resample(y, sr, YAMNET_SR)
+    
+    # One STFT feeds both chroma and the spectral mood features
+    S = compute_spectrogram(y)
+    
+    return {
+        "duration": float(len(y) / sr),
+        "bpm": detect_bpm(y, sr),
+        "key": detect_key(y, sr, S),
+        "mood_tags": detect_mood(y, sr, S),
+        "y16k": y16k
+    }
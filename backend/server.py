@@ -6,22 +6,31 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Union
 import uuid
+import hashlib
+import re
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone, timedelta
 import tempfile
-import shutil
+import aiofiles
+import csv
+import urllib.request
 
 # Audio analysis imports
-import librosa
 import numpy as np
 import tensorflow as tf
 import tensorflow_hub as hub
 from scipy.stats import mode
+from dsp import analyze_dsp
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -36,7 +45,7 @@ pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Create the main app without a prefix
@@ -45,22 +54,288 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Chunk size for streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# YAMNet class map
+YAMNET_CLASS_MAP_PATH = ROOT_DIR / 'data' / 'yamnet_class_map.csv'
+
+# Quantized TFLite YAMNet (fixed 0.975 s input, 0.48 s hop between frames)
+YAMNET_TFLITE_URL = 'https://tfhub.dev/google/lite-model/yamnet/classification/tflite/1?lite-format=tflite'
+YAMNET_TFLITE_PATH = Path(os.environ.get('YAMNET_TFLITE_PATH', ROOT_DIR / 'models' / 'yamnet_quant.tflite'))
+YAMNET_FRAME_SAMPLES = 15600
+YAMNET_HOP_SAMPLES = 7680
+
+# Dynamic batching window for YAMNet inference
+YAMNET_MAX_BATCH = 32
+YAMNET_BATCH_TIMEOUT = 0.02
+
+# Instrument keywords to look for in YAMNet class names
+INSTRUMENT_KEYWORDS = [
+    'piano', 'guitar', 'drum', 'bass', 'violin', 'trumpet', 
+    'saxophone', 'flute', 'synthesizer', 'keyboard', 'organ',
+    'percussion', 'string', 'brass', 'woodwind', 'electronic'
+]
+INSTRUMENT_RE = re.compile('|'.join(re.escape(k) for k in INSTRUMENT_KEYWORDS), re.IGNORECASE)
+
+# Stable ordering for paginated track listings
+TRACK_SORT = [('analyzed_at', -1), ('id', 1)]
+
+# Indexes on the tracks collection; keep mongo-init.js in sync
+TRACK_INDEXES = [
+    ('id', {'unique': True}),
+    # Serves /tracks filter + sort + skip/limit from one index (and user_id lookups via its prefix)
+    ([('user_id', 1)] + TRACK_SORT, {}),
+    # Serves the /search sort, which has no user filter
+    (TRACK_SORT, {}),
+    ('bpm', {}),
+    ('key', {}),
+    ('instruments.name', {}),
+    ('mood_tags', {}),
+    ('content_hash', {}),
+]
+
+# Process pool for CPU-bound decode and librosa DSP
+DSP_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+DSP_POOL: Optional[ProcessPoolExecutor] = None
+
+# Caps analyses in flight so decoded audio held for YAMNet stays bounded
+ANALYSIS_SEMAPHORE = asyncio.Semaphore(DSP_WORKERS)
+
+def create_dsp_pool() -> ProcessPoolExecutor:
+    """Create the DSP worker pool.
+    
+    Workers are spawned (rather than forked) so they don't inherit TensorFlow
+    runtime state; they only import the light dsp module, not this one.
+    """
+    return ProcessPoolExecutor(
+        max_workers=DSP_WORKERS,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+async def run_dsp(tmp_path: str, want_16k: bool) -> dict:
+    """Run analyze_dsp in DSP_POOL, replacing the pool if a worker died"""
+    global DSP_POOL
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = DSP_POOL
+        try:
+            return await loop.run_in_executor(pool, analyze_dsp, tmp_path, want_16k)
+        except BrokenProcessPool:
+            # A dead worker (e.g. OOM) breaks the pool for good; concurrent requests may race here
+            if DSP_POOL is pool:
+                logging.error("DSP worker pool is broken, recreating it")
+                DSP_POOL = create_dsp_pool()
+                pool.shutdown(wait=False, cancel_futures=True)
+            if attempt:
+                raise
+
 # Load ML models globally
 yamnet_model = None
-openl3_model = None
+yamnet_interpreter = None
+YAMNET_CLASS_NAMES: List[str] = []
+INSTRUMENT_MASK = np.zeros(0, dtype=bool)
+
+def load_yamnet_class_map() -> None:
+    """Load the bundled YAMNet class names and precompute the instrument mask"""
+    global YAMNET_CLASS_NAMES, INSTRUMENT_MASK
+    if not YAMNET_CLASS_MAP_PATH.exists():
+        raise FileNotFoundError(
+            f"YAMNet class map not found at {YAMNET_CLASS_MAP_PATH}; "
+            "it must ship with the backend (see DEPLOYMENT.md)"
+        )
+    
+    with open(YAMNET_CLASS_MAP_PATH, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)  # Skip header
+        YAMNET_CLASS_NAMES = [row[2].strip() for row in reader]
+    INSTRUMENT_MASK = np.array(
+        [bool(INSTRUMENT_RE.search(n)) for n in YAMNET_CLASS_NAMES],
+        dtype=bool
+    )
+
+def download_yamnet_tflite():
+    """Fetch the TFLite YAMNet next to its final path and rename it into place,
+    so an interrupted or bogus download never leaves a file at YAMNET_TFLITE_PATH"""
+    YAMNET_TFLITE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=YAMNET_TFLITE_PATH.parent, suffix='.part')
+    os.close(tmp_fd)
+    try:
+        urllib.request.urlretrieve(YAMNET_TFLITE_URL, tmp_path)
+        with open(tmp_path, 'rb') as f:
+            header = f.read(8)
+        # TFLite flatbuffers carry the "TFL3" file identifier at bytes 4-8
+        if header[4:8] != b'TFL3':
+            raise ValueError(f"Downloaded YAMNet model from {YAMNET_TFLITE_URL} is not a TFLite file")
+        os.replace(tmp_path, YAMNET_TFLITE_PATH)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def load_yamnet_tflite():
+    """Load the quantized TFLite YAMNet, downloading it on first use"""
+    if not YAMNET_TFLITE_PATH.exists():
+        download_yamnet_tflite()
+    # The default op resolver applies the XNNPACK delegate on CPU
+    interpreter = tf.lite.Interpreter(
+        model_path=str(YAMNET_TFLITE_PATH),
+        num_threads=os.cpu_count()
+    )
+    interpreter.allocate_tensors()
+    return interpreter
+
+class YamnetBatcher:
+    """Coalesce YAMNet frames from concurrent requests into batched interpreter calls"""
+    
+    def __init__(self, max_batch: int = YAMNET_MAX_BATCH, wait_timeout: float = YAMNET_BATCH_TIMEOUT):
+        self.max_batch = max_batch
+        self.wait_timeout = wait_timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.supports_batching: Optional[bool] = None
+    
+    def start(self):
+        """Start the background batching worker"""
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the background batching worker"""
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+    
+    async def submit(self, frames: np.ndarray) -> np.ndarray:
+        """Queue [N, 15600] frames and wait for their [N, 521] scores"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((frames, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            n_frames = len(pending[0][0])
+            deadline = loop.time() + self.wait_timeout
+            
+            # Keep collecting until the batch is full or the window closes
+            while n_frames < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                n_frames += len(item[0])
+            
+            batch = np.concatenate([frames for frames, _ in pending])
+            try:
+                scores = await loop.run_in_executor(None, self._invoke, batch)
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            offset = 0
+            for frames, future in pending:
+                if not future.done():
+                    future.set_result(scores[offset:offset + len(frames)])
+                offset += len(frames)
+    
+    def _invoke(self, batch: np.ndarray) -> np.ndarray:
+        """Run the interpreter over the batch in max_batch sized chunks"""
+        return np.concatenate([
+            self._invoke_chunk(batch[i:i + self.max_batch])
+            for i in range(0, len(batch), self.max_batch)
+        ])
+    
+    def _invoke_chunk(self, chunk: np.ndarray) -> np.ndarray:
+        input_details = yamnet_interpreter.get_input_details()[0]
+        output_index = yamnet_interpreter.get_output_details()[0]['index']
+        
+        if self.supports_batching is not False:
+            try:
+                shape = [len(chunk), YAMNET_FRAME_SAMPLES]
+                if list(input_details['shape']) != shape:
+                    yamnet_interpreter.resize_tensor_input(input_details['index'], shape)
+                    yamnet_interpreter.allocate_tensors()
+                yamnet_interpreter.set_tensor(input_details['index'], chunk)
+                yamnet_interpreter.invoke()
+                scores = yamnet_interpreter.get_tensor(output_index)
+                if scores.shape[0] == len(chunk):
+                    # A single frame passes on any model; only a real batch proves support
+                    if len(chunk) > 1:
+                        self.supports_batching = True
+                    return scores.reshape(len(chunk), -1)
+            except Exception as e:
+                logging.warning(f"YAMNet model does not accept batched input, invoking per frame: {e}")
+            
+            # Model graph is fixed to a single frame; restore its original input shape
+            self.supports_batching = False
+            yamnet_interpreter.resize_tensor_input(input_details['index'], [YAMNET_FRAME_SAMPLES])
+            yamnet_interpreter.allocate_tensors()
+            input_details = yamnet_interpreter.get_input_details()[0]
+        
+        frame_scores = []
+        for frame in chunk:
+            yamnet_interpreter.set_tensor(input_details['index'], frame)
+            yamnet_interpreter.invoke()
+            frame_scores.append(yamnet_interpreter.get_tensor(output_index).reshape(-1))
+        return np.stack(frame_scores)
+
+yamnet_batcher = YamnetBatcher()
 
 @app.on_event("startup")
 async def startup_event():
     """Load ML models on startup"""
-    global yamnet_model, openl3_model
+    global yamnet_model, yamnet_interpreter, DSP_POOL
+    
+    # Convert analyzed_at values stored as ISO strings by older versions to BSON dates
+    try:
+        updates = [
+            UpdateOne({"_id": track["_id"]}, {"$set": {"analyzed_at": datetime.fromisoformat(track["analyzed_at"])}})
+            async for track in db.tracks.find({"analyzed_at": {"$type": "string"}}, {"analyzed_at": 1})
+        ]
+        if updates:
+            await db.tracks.bulk_write(updates)
+            logging.info(f"Migrated analyzed_at to BSON dates for {len(updates)} tracks")
+    except Exception as e:
+        logging.error(f"Error migrating analyzed_at timestamps: {e}")
+    
+    # Indexes for track lookups, search filters and paginated listing;
+    # created one at a time so a failure (e.g. duplicate ids) doesn't skip the rest
+    for keys, options in TRACK_INDEXES:
+        try:
+            await db.tracks.create_index(keys, **options)
+        except Exception as e:
+            logging.error(f"Error creating index {keys} on tracks: {e}")
+    
+    DSP_POOL = create_dsp_pool()
+    
+    # The class map ships with the code; a missing file is a broken deployment, so fail startup
+    logging.info("Loading YAMNet class map...")
+    load_yamnet_class_map()
+    logging.info(f"Loaded {len(YAMNET_CLASS_NAMES)} YAMNet classes")
+    
     try:
-        # Load YAMNet model
-        logging.info("Loading YAMNet model...")
-        yamnet_model = hub.load('https://tfhub.dev/google/yamnet/1')
-        logging.info("YAMNet model loaded successfully")
+        # Load quantized TFLite YAMNet, falling back to the TF-Hub model
+        logging.info("Loading YAMNet TFLite model...")
+        try:
+            yamnet_interpreter = load_yamnet_tflite()
+            yamnet_batcher.start()
+            logging.info("YAMNet TFLite model loaded successfully")
+        except Exception as e:
+            logging.warning(f"Error loading YAMNet TFLite model, falling back to TF-Hub: {e}")
+            yamnet_model = hub.load('https://tfhub.dev/google/yamnet/1')
+            logging.info("YAMNet model loaded successfully")
         
-        # OpenL3 would require separate installation - using YAMNet for both for now
-        openl3_model = yamnet_model
         logging.info("Models loaded successfully")
     except Exception as e:
         logging.error(f"Error loading models: {e}")
@@ -73,12 +348,13 @@ class TrackMetadata(BaseModel):
     filename: str
     bpm: float
     key: str
-    instruments: List[Dict[str, float]]  # [{"name": "piano", "confidence": 0.85}]
+    instruments: List[Dict[str, Union[str, float]]]  # [{"name": "piano", "confidence": 0.85}]
     mood_tags: List[str]
     duration: float
     analyzed_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     file_size: int
     format: str
+    content_hash: Optional[str] = None  # SHA-256 of the uploaded bytes
 
 class AnalyzeRequest(BaseModel):
     use_yamnet: bool = True
@@ -112,83 +388,39 @@ class TokenData(BaseModel):
     username: Optional[str] = None
 
 # Audio Analysis Functions
-def detect_bpm(audio_path: str) -> float:
-    """Detect BPM using librosa"""
-    try:
-        y, sr = librosa.load(audio_path)
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        return float(tempo)
-    except Exception as e:
-        logging.error(f"Error detecting BPM: {e}")
-        return 120.0  # Default BPM
-
-def detect_key(audio_path: str) -> str:
-    """Detect musical key using librosa chroma features"""
-    try:
-        y, sr = librosa.load(audio_path)
-        chromagram = librosa.feature.chroma_cqt(y=y, sr=sr)
-        chroma_mean = np.mean(chromagram, axis=1)
-        
-        # Key mapping
-        keys = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        key_idx = np.argmax(chroma_mean)
-        
-        # Simple major/minor detection based on chord pattern
-        major_profile = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
-        minor_profile = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
-        
-        major_correlation = np.corrcoef(chroma_mean, np.roll(major_profile, key_idx))[0, 1]
-        minor_correlation = np.corrcoef(chroma_mean, np.roll(minor_profile, key_idx))[0, 1]
-        
-        scale = "major" if major_correlation > minor_correlation else "minor"
-        return f"{keys[key_idx]} {scale}"
-    except Exception as e:
-        logging.error(f"Error detecting key: {e}")
-        return "C major"  # Default key
-
-def detect_instruments(audio_path: str, use_yamnet: bool, use_openl3: bool) -> List[Dict[str, float]]:
-    """Detect instruments using YAMNet and/or OpenL3"""
+def frame_yamnet_input(y16k: np.ndarray) -> np.ndarray:
+    """Split 16 kHz audio into fixed-size YAMNet frames"""
+    y16k = np.asarray(y16k, dtype=np.float32)
+    if len(y16k) < YAMNET_FRAME_SAMPLES:
+        y16k = np.pad(y16k, (0, YAMNET_FRAME_SAMPLES - len(y16k)))
+    n_frames = 1 + (len(y16k) - YAMNET_FRAME_SAMPLES) // YAMNET_HOP_SAMPLES
+    starts = np.arange(n_frames) * YAMNET_HOP_SAMPLES
+    return np.stack([y16k[s:s + YAMNET_FRAME_SAMPLES] for s in starts])
+
+async def yamnet_scores(y16k: np.ndarray) -> np.ndarray:
+    """Run YAMNet and return the mean score per class"""
+    if yamnet_interpreter is not None:
+        frame_scores = await yamnet_batcher.submit(frame_yamnet_input(y16k))
+        return np.mean(frame_scores, axis=0)
+    
+    scores, embeddings, spectrogram = yamnet_model(y16k)
+    return np.mean(scores.numpy(), axis=0)
+
+async def detect_instruments(y16k: np.ndarray) -> List[Dict[str, Union[str, float]]]:
+    """Detect instruments using YAMNet on 16 kHz mono audio"""
     instruments = []
     
     try:
-        if not use_yamnet and not use_openl3:
-            return instruments
+        if yamnet_interpreter or yamnet_model:
+            scores_mean = await yamnet_scores(y16k)
             
-        # Load audio
-        y, sr = librosa.load(audio_path, sr=16000, mono=True)
-        
-        if use_yamnet and yamnet_model:
-            # YAMNet expects audio in specific format
-            scores, embeddings, spectrogram = yamnet_model(y)
-            scores_mean = np.mean(scores.numpy(), axis=0)
-            
-            # Get class names from YAMNet
-            class_names_url = 'https://raw.githubusercontent.com/tensorflow/models/master/research/audioset/yamnet/yamnet_class_map.csv'
-            import urllib.request
-            import csv
-            
-            # Load class names
-            with urllib.request.urlopen(class_names_url) as response:
-                class_names = [line.decode('utf-8').split(',')[2].strip() for line in response]
-            
-            # Instrument keywords to look for
-            instrument_keywords = [
-                'piano', 'guitar', 'drum', 'bass', 'violin', 'trumpet', 
-                'saxophone', 'flute', 'synthesizer', 'keyboard', 'organ',
-                'percussion', 'string', 'brass', 'woodwind', 'electronic'
-            ]
-            
-            # Find relevant instruments
-            for idx, score in enumerate(scores_mean):
-                if score > 0.1:  # Threshold
-                    class_name = class_names[idx]
-                    for keyword in instrument_keywords:
-                        if keyword in class_name.lower():
-                            instruments.append({
-                                "name": class_name,
-                                "confidence": float(score)
-                            })
-                            break
+            # Find relevant instruments above the confidence threshold
+            if len(INSTRUMENT_MASK) == len(scores_mean):
+                idxs = np.flatnonzero((scores_mean > 0.1) & INSTRUMENT_MASK)
+                instruments = [
+                    {"name": YAMNET_CLASS_NAMES[idx], "confidence": float(scores_mean[idx])}
+                    for idx in idxs
+                ]
         
         # Sort by confidence and limit to top 10
         instruments = sorted(instruments, key=lambda x: x['confidence'], reverse=True)[:10]
@@ -198,50 +430,12 @@ def detect_instruments(audio_path: str, use_yamnet: bool, use_openl3: bool) -> L
     
     return instruments
 
-def detect_mood(audio_path: str) -> List[str]:
-    """Detect mood tags using spectral features"""
-    try:
-        y, sr = librosa.load(audio_path)
-        
-        # Extract features
-        spectral_centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-        spectral_rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr))
-        zero_crossing_rate = np.mean(librosa.feature.zero_crossing_rate(y))
-        rms = np.mean(librosa.feature.rms(y=y))
-        
-        moods = []
-        
-        # Brightness
-        if spectral_centroid > 2000:
-            moods.append("bright")
-        elif spectral_centroid < 1000:
-            moods.append("dark")
-        
-        # Energy
-        if rms > 0.1:
-            moods.append("energetic")
-        elif rms < 0.05:
-            moods.append("calm")
-        
-        # Texture
-        if zero_crossing_rate > 0.15:
-            moods.append("aggressive")
-        elif zero_crossing_rate < 0.05:
-            moods.append("smooth")
-        
-        # Additional mood tags based on spectral rolloff
-        if spectral_rolloff > 4000:
-            moods.append("sharp")
-        else:
-            moods.append("warm")
-        
-        return moods if moods else ["neutral"]
-    except Exception as e:
-        logging.error(f"Error detecting mood: {e}")
-        return ["neutral"]
-
 # Helper function for single file analysis
-async def analyze_single_file(file: UploadFile, use_yamnet: bool, use_openl3: bool) -> TrackMetadata:
+def wants_instruments(use_yamnet: bool, use_openl3: bool) -> bool:
+    """Resolve the instrument detection flags; OpenL3 is served by YAMNet"""
+    return use_yamnet or use_openl3
+
+async def analyze_single_file(file: UploadFile, use_yamnet: bool) -> TrackMetadata:
     """Analyze a single audio file"""
     allowed_extensions = ['.wav', '.mp3', '.flac', '.m4a', '.ogg']
     file_ext = Path(file.filename).suffix.lower()
@@ -249,33 +443,54 @@ async def analyze_single_file(file: UploadFile, use_yamnet: bool, use_openl3: bo
     if file_ext not in allowed_extensions:
         raise HTTPException(status_code=400, detail=f"File type {file_ext} not supported. Allowed: {allowed_extensions}")
     
-    # Create temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as tmp_file:
-        shutil.copyfileobj(file.file, tmp_file)
-        tmp_path = tmp_file.name
+    # Create temporary file; the DSP worker process reads it by path
+    tmp_fd, tmp_path = tempfile.mkstemp(suffix=file_ext)
+    os.close(tmp_fd)
     
     try:
-        # Get file info
-        file_size = os.path.getsize(tmp_path)
-        y, sr = librosa.load(tmp_path, sr=None)
-        duration = float(librosa.get_duration(y=y, sr=sr))
+        # Stream the upload to disk without blocking the event loop, hashing as we go
+        file_size = 0
+        hasher = hashlib.sha256()
+        async with aiofiles.open(tmp_path, 'wb') as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                file_size += len(chunk)
+                hasher.update(chunk)
+                await out.write(chunk)
+        content_hash = hasher.hexdigest()
+        
+        # Reuse the newest previous analysis of identical audio, whoever uploaded it;
+        # only the acoustic fields are copied, never the owner or track id
+        cached = await db.tracks.find_one({"content_hash": content_hash}, {"_id": 0}, sort=TRACK_SORT)
+        # An empty instrument list may just mean YAMNet was skipped, so re-analyze then
+        if cached and (cached["instruments"] or not use_yamnet):
+            return TrackMetadata(
+                filename=file.filename,
+                bpm=cached["bpm"],
+                key=cached["key"],
+                instruments=cached["instruments"] if use_yamnet else [],
+                mood_tags=cached["mood_tags"],
+                duration=cached["duration"],
+                file_size=file_size,
+                format=file_ext.lstrip('.'),
+                content_hash=content_hash
+            )
         
-        # Perform analysis
-        bpm = detect_bpm(tmp_path)
-        key = detect_key(tmp_path)
-        instruments = detect_instruments(tmp_path, use_yamnet, use_openl3)
-        mood_tags = detect_mood(tmp_path)
+        # Perform DSP off the event loop; YAMNet stays in this process so it can batch
+        async with ANALYSIS_SEMAPHORE:
+            dsp = await run_dsp(tmp_path, use_yamnet)
+            instruments = await detect_instruments(dsp["y16k"]) if use_yamnet else []
         
         # Create metadata
         metadata = TrackMetadata(
             filename=file.filename,
-            bpm=bpm,
-            key=key,
+            bpm=dsp["bpm"],
+            key=dsp["key"],
             instruments=instruments,
-            mood_tags=mood_tags,
-            duration=duration,
+            mood_tags=dsp["mood_tags"],
+            duration=dsp["duration"],
             file_size=file_size,
-            format=file_ext.lstrip('.')
+            format=file_ext.lstrip('.'),
+            content_hash=content_hash
         )
         
         return metadata
@@ -401,11 +616,10 @@ async def analyze_audio(
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """Upload and analyze single audio file"""
-    metadata = await analyze_single_file(file, use_yamnet, use_openl3)
+    metadata = await analyze_single_file(file, wants_instruments(use_yamnet, use_openl3))
     
     # Store in database with user association
     doc = metadata.model_dump()
-    doc['analyzed_at'] = doc['analyzed_at'].isoformat()
     doc['user_id'] = current_user.username
     await db.tracks.insert_one(doc)
     
@@ -422,27 +636,34 @@ async def analyze_batch(
     results = []
     errors = []
     
-    for file in files:
-        try:
-            metadata = await analyze_single_file(file, use_yamnet, use_openl3)
-            
-            # Store in database with user association
-            doc = metadata.model_dump()
-            doc['analyzed_at'] = doc['analyzed_at'].isoformat()
-            doc['user_id'] = current_user.username
-            await db.tracks.insert_one(doc)
-            
-            results.append({
-                "filename": file.filename,
-                "status": "success",
-                "metadata": metadata.model_dump()
-            })
-        except Exception as e:
-            logging.error(f"Error analyzing {file.filename}: {e}")
+    async def analyze_and_store(file: UploadFile) -> TrackMetadata:
+        metadata = await analyze_single_file(file, wants_instruments(use_yamnet, use_openl3))
+        
+        # Store in database with user association
+        doc = metadata.model_dump()
+        doc['user_id'] = current_user.username
+        await db.tracks.insert_one(doc)
+        return metadata
+    
+    # Analyze all files concurrently across the DSP pool
+    outcomes = await asyncio.gather(
+        *[analyze_and_store(file) for file in files],
+        return_exceptions=True
+    )
+    
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            logging.error(f"Error analyzing {file.filename}: {outcome}")
             errors.append({
                 "filename": file.filename,
                 "status": "error",
-                "error": str(e)
+                "error": str(outcome)
+            })
+        else:
+            results.append({
+                "filename": file.filename,
+                "status": "success",
+                "metadata": outcome.model_dump()
             })
     
     return {
@@ -454,14 +675,16 @@ async def analyze_batch(
     }
 
 @api_router.get("/tracks", response_model=List[TrackMetadata])
-async def get_tracks(current_user: UserInDB = Depends(get_current_active_user)):
-    """Get all analyzed tracks"""
-    tracks = await db.tracks.find({"user_id": current_user.username}, {"_id": 0}).to_list(1000)
-    
-    # Convert ISO string timestamps back to datetime objects
-    for track in tracks:
-        if isinstance(track['analyzed_at'], str):
-            track['analyzed_at'] = datetime.fromisoformat(track['analyzed_at'])
+async def get_tracks(
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """Get analyzed tracks, optionally paginated with skip/limit"""
+    cursor = db.tracks.find({"user_id": current_user.username}, {"_id": 0}).sort(TRACK_SORT).skip(skip)
+    if limit:
+        cursor = cursor.limit(limit)
+    tracks = await cursor.to_list(None)
     
     return tracks
 
@@ -473,9 +696,6 @@ async def get_track(track_id: str):
     if not track:
         raise HTTPException(status_code=404, detail="Track not found")
     
-    if isinstance(track['analyzed_at'], str):
-        track['analyzed_at'] = datetime.fromisoformat(track['analyzed_at'])
-    
     return track
 
 @api_router.delete("/track/{track_id}")
@@ -489,8 +709,12 @@ async def delete_track(track_id: str):
     return {"message": "Track deleted successfully"}
 
 @api_router.post("/search", response_model=List[TrackMetadata])
-async def search_tracks(filters: SearchFilters):
-    """Search tracks with filters"""
+async def search_tracks(
+    filters: SearchFilters,
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1)
+):
+    """Search tracks with filters, optionally paginated with skip/limit"""
     query = {}
     
     # BPM filters
@@ -513,24 +737,41 @@ async def search_tracks(filters: SearchFilters):
     if filters.mood_tags:
         query['mood_tags'] = {'$in': filters.mood_tags}
     
-    tracks = await db.tracks.find(query, {"_id": 0}).to_list(1000)
-    
-    # Convert ISO string timestamps
-    for track in tracks:
-        if isinstance(track['analyzed_at'], str):
-            track['analyzed_at'] = datetime.fromisoformat(track['analyzed_at'])
+    cursor = db.tracks.find(query, {"_id": 0}).sort(TRACK_SORT).skip(skip)
+    if limit:
+        cursor = cursor.limit(limit)
+    tracks = await cursor.to_list(None)
     
     return tracks
 
 @api_router.get("/stats")
 async def get_stats():
     """Get database statistics"""
-    total_tracks = await db.tracks.count_documents({})
-    
-    # Get all tracks for stats
-    tracks = await db.tracks.find({}, {"_id": 0}).to_list(1000)
+    # Aggregate in MongoDB so only the summary crosses the wire
+    pipeline = [
+        {'$facet': {
+            'totals': [
+                {'$group': {
+                    '_id': None,
+                    'avg_bpm': {'$avg': '$bpm'},
+                    'total_duration': {'$sum': '$duration'},
+                    'n': {'$sum': 1}
+                }}
+            ],
+            'keys': [
+                {'$sortByCount': '$key'},
+                {'$limit': 5}
+            ],
+            'moods': [
+                {'$unwind': '$mood_tags'},
+                {'$sortByCount': '$mood_tags'},
+                {'$limit': 5}
+            ]
+        }}
+    ]
+    stats = (await db.tracks.aggregate(pipeline).to_list(1))[0]
     
-    if not tracks:
+    if not stats['totals']:
         return {
             "total_tracks": 0,
             "avg_bpm": 0,
@@ -539,32 +780,13 @@ async def get_stats():
             "total_duration": 0
         }
     
-    # Calculate stats
-    avg_bpm = np.mean([t['bpm'] for t in tracks])
-    total_duration = sum([t['duration'] for t in tracks])
-    
-    # Common keys
-    keys = [t['key'] for t in tracks]
-    key_counts = {}
-    for k in keys:
-        key_counts[k] = key_counts.get(k, 0) + 1
-    common_keys = sorted(key_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-    
-    # Common moods
-    all_moods = []
-    for t in tracks:
-        all_moods.extend(t['mood_tags'])
-    mood_counts = {}
-    for m in all_moods:
-        mood_counts[m] = mood_counts.get(m, 0) + 1
-    common_moods = sorted(mood_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-    
+    totals = stats['totals'][0]
     return {
-        "total_tracks": total_tracks,
-        "avg_bpm": round(avg_bpm, 2),
-        "common_keys": [k[0] for k in common_keys],
-        "common_moods": [m[0] for m in common_moods],
-        "total_duration": round(total_duration, 2)
+        "total_tracks": totals['n'],
+        "avg_bpm": round(totals['avg_bpm'] or 0, 2),
+        "common_keys": [k['_id'] for k in stats['keys']],
+        "common_moods": [m['_id'] for m in stats['moods']],
+        "total_duration": round(totals['total_duration'], 2)
     }
 
 # Include the router in the main app
@@ -587,4 +809,7 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await yamnet_batcher.stop()
+    if DSP_POOL:
+        DSP_POOL.shutdown(wait=False, cancel_futures=True)
     client.close()
\ No newline at end of file
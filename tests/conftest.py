@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The backend runs from its own directory (see Dockerfile), so import its modules the same way
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
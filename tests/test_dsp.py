@@ -0,0 +1,67 @@
+import librosa
+import numpy as np
+import pytest
+
+from dsp import (
+    RMS_FRAME_LENGTH,
+    RMS_HOP_LENGTH,
+    ROLLOFF_PERCENT,
+    STFT_N_FFT,
+    analyze_spectrogram,
+    mean_zcr_int16,
+)
+
+
+def reference_zcr(pcm: np.ndarray) -> float:
+    """Zero crossings per sample, counting zero as positive"""
+    if len(pcm) < 2:
+        return 0.0
+    sign = pcm < 0
+    return np.count_nonzero(sign[1:] != sign[:-1]) / len(pcm)
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 1000, 1001, 1002, 1003, 22050])
+def test_mean_zcr_int16_matches_reference(n):
+    rng = np.random.default_rng(n)
+    pcm = rng.integers(-32768, 32768, size=n, dtype=np.int16)
+    assert mean_zcr_int16(pcm) == pytest.approx(reference_zcr(pcm))
+
+
+def test_mean_zcr_int16_edge_values():
+    # Zeros count as positive; extremes exercise the sign bit in every lane
+    pcm = np.array([0, -1, 0, 32767, -32768, -32768, 0, 0, -1, 1, 0, -32768, 32767], dtype=np.int16)
+    for n in range(len(pcm) + 1):
+        assert mean_zcr_int16(pcm[:n]) == pytest.approx(reference_zcr(pcm[:n]))
+
+
+def test_mean_zcr_int16_constant_signal():
+    assert mean_zcr_int16(np.zeros(4096, dtype=np.int16)) == 0.0
+    assert mean_zcr_int16(np.full(4096, -7, dtype=np.int16)) == 0.0
+
+
+def test_mean_zcr_int16_alternating_signal():
+    pcm = np.tile(np.array([100, -100], dtype=np.int16), 2050)
+    assert mean_zcr_int16(pcm) == pytest.approx((len(pcm) - 1) / len(pcm))
+
+
+@pytest.mark.parametrize("n_samples", [1000, 4096, 22050 * 3 + 17])
+def test_analyze_spectrogram_matches_numpy(n_samples):
+    sr = 22050
+    rng = np.random.default_rng(n_samples)
+    y = (0.3 * rng.standard_normal(n_samples)).astype(np.float32)
+    S = rng.random((STFT_N_FFT // 2 + 1, 40)).astype(np.float32)
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=STFT_N_FFT)
+
+    centroid, rolloff, rms = analyze_spectrogram(
+        np.ascontiguousarray(S.T), freqs, y, RMS_FRAME_LENGTH, RMS_HOP_LENGTH, ROLLOFF_PERCENT
+    )
+
+    expected_centroid = np.mean((freqs[:, None] * S).sum(axis=0) / S.sum(axis=0))
+    cumulative = np.cumsum(S, axis=0)
+    rolloff_idx = np.argmax(cumulative >= ROLLOFF_PERCENT * cumulative[-1], axis=0)
+    expected_rolloff = np.mean(freqs[rolloff_idx])
+    expected_rms = np.mean(librosa.feature.rms(y=y, frame_length=RMS_FRAME_LENGTH, hop_length=RMS_HOP_LENGTH))
+
+    assert centroid == pytest.approx(expected_centroid, rel=1e-5)
+    assert rolloff == pytest.approx(expected_rolloff, rel=1e-5)
+    assert rms == pytest.approx(expected_rms, rel=1e-5)
@@ -0,0 +1,293 @@
+import asyncio
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import server
+
+
+def test_bundled_yamnet_class_map():
+    server.load_yamnet_class_map()
+    assert len(server.YAMNET_CLASS_NAMES) == 521
+    assert server.YAMNET_CLASS_NAMES[0] == "Speech"
+    assert server.YAMNET_CLASS_NAMES[132] == "Music"
+    assert len(server.INSTRUMENT_MASK) == 521
+    assert server.INSTRUMENT_MASK.any()
+    assert server.INSTRUMENT_MASK[server.YAMNET_CLASS_NAMES.index("Piano")]
+    assert not server.INSTRUMENT_MASK[0]
+
+
+class FakePool:
+    """Executor stand-in that runs jobs inline or fails as a broken pool"""
+
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.shut_down = False
+
+    def submit(self, fn, *args):
+        future = concurrent.futures.Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("worker died"))
+        else:
+            future.set_result({"args": args})
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_run_dsp_recreates_broken_pool(monkeypatch):
+    broken = FakePool(broken=True)
+    fresh = FakePool()
+    monkeypatch.setattr(server, "DSP_POOL", broken)
+    monkeypatch.setattr(server, "create_dsp_pool", lambda: fresh)
+
+    result = asyncio.run(server.run_dsp("track.wav", True))
+
+    assert result == {"args": ("track.wav", True)}
+    assert server.DSP_POOL is fresh
+    assert broken.shut_down
+
+
+def test_run_dsp_fails_request_when_fresh_pool_breaks_too(monkeypatch):
+    pools = [FakePool(broken=True), FakePool(broken=True)]
+    monkeypatch.setattr(server, "DSP_POOL", pools[0])
+    monkeypatch.setattr(server, "create_dsp_pool", lambda: pools.pop())
+
+    with pytest.raises(BrokenProcessPool):
+        asyncio.run(server.run_dsp("track.wav", False))
+
+
+def test_download_yamnet_tflite_renames_valid_model(tmp_path, monkeypatch):
+    target = tmp_path / 'models' / 'yamnet_quant.tflite'
+    monkeypatch.setattr(server, 'YAMNET_TFLITE_PATH', target)
+    monkeypatch.setattr(server.urllib.request, 'urlretrieve',
+                        lambda url, path: Path(path).write_bytes(b'\x1c\x00\x00\x00TFL3model'))
+
+    server.download_yamnet_tflite()
+
+    assert target.read_bytes() == b'\x1c\x00\x00\x00TFL3model'
+    assert list(target.parent.iterdir()) == [target]
+
+
+def test_download_yamnet_tflite_discards_invalid_model(tmp_path, monkeypatch):
+    target = tmp_path / 'models' / 'yamnet_quant.tflite'
+    monkeypatch.setattr(server, 'YAMNET_TFLITE_PATH', target)
+    monkeypatch.setattr(server.urllib.request, 'urlretrieve',
+                        lambda url, path: Path(path).write_bytes(b'<html>rate limited</html>'))
+
+    with pytest.raises(ValueError):
+        server.download_yamnet_tflite()
+
+    assert list(target.parent.iterdir()) == []
+
+
+class StubInterpreter:
+    """Minimal tf.lite.Interpreter whose scores echo each frame's first sample"""
+
+    def __init__(self, batched=True, fail=False):
+        self.batched = batched
+        self.fail = fail
+        self.shape = [server.YAMNET_FRAME_SAMPLES]
+        self.invocations = 0
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': np.array(self.shape)}]
+
+    def get_output_details(self):
+        return [{'index': 1}]
+
+    def resize_tensor_input(self, index, shape):
+        if not self.batched and list(shape) != [server.YAMNET_FRAME_SAMPLES]:
+            raise ValueError('fixed input shape')
+        self.shape = list(shape)
+
+    def allocate_tensors(self):
+        pass
+
+    def set_tensor(self, index, value):
+        self.input = np.asarray(value).reshape(-1, server.YAMNET_FRAME_SAMPLES)
+
+    def invoke(self):
+        if self.fail:
+            raise RuntimeError('invoke failed')
+        self.invocations += 1
+
+    def get_tensor(self, index):
+        return np.repeat(self.input[:, :1], 521, axis=1)
+
+
+def frames(*values):
+    return np.stack([np.full(server.YAMNET_FRAME_SAMPLES, v, dtype=np.float32) for v in values])
+
+
+def run_batcher(interpreter, monkeypatch, *requests):
+    monkeypatch.setattr(server, 'yamnet_interpreter', interpreter)
+    batcher = server.YamnetBatcher()
+
+    async def main():
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(r) for r in requests), return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    return batcher, asyncio.run(main())
+
+
+def test_yamnet_batcher_returns_each_request_its_own_slice(monkeypatch):
+    interpreter = StubInterpreter()
+    batcher, results = run_batcher(interpreter, monkeypatch, frames(1, 2), frames(3), frames(4, 5, 6))
+
+    assert [r[:, 0].tolist() for r in results] == [[1, 2], [3], [4, 5, 6]]
+    assert all(r.shape[1] == 521 for r in results)
+    assert interpreter.invocations == 1
+    assert batcher.supports_batching is True
+
+
+def test_yamnet_batcher_propagates_invoke_errors_to_every_request(monkeypatch):
+    _, results = run_batcher(StubInterpreter(fail=True), monkeypatch, frames(1), frames(2, 3))
+
+    assert len(results) == 2
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_yamnet_batcher_falls_back_to_per_frame_invocation(monkeypatch):
+    interpreter = StubInterpreter(batched=False)
+    batcher, results = run_batcher(interpreter, monkeypatch, frames(1, 2), frames(3))
+
+    assert [r[:, 0].tolist() for r in results] == [[1, 2], [3]]
+    assert interpreter.invocations == 3
+    assert interpreter.shape == [server.YAMNET_FRAME_SAMPLES]
+    assert batcher.supports_batching is False
+
+
+def test_yamnet_batcher_single_frame_does_not_prove_batching(monkeypatch):
+    batcher, results = run_batcher(StubInterpreter(), monkeypatch, frames(7))
+
+    assert results[0][:, 0].tolist() == [7]
+    assert batcher.supports_batching is None
+
+
+def test_frame_yamnet_input_pads_short_audio():
+    framed = server.frame_yamnet_input(np.ones(1000))
+
+    assert framed.shape == (1, server.YAMNET_FRAME_SAMPLES)
+    assert framed.dtype == np.float32
+    assert framed[0, :1000].all()
+    assert not framed[0, 1000:].any()
+
+
+@pytest.mark.parametrize('n_samples, n_frames', [
+    (server.YAMNET_FRAME_SAMPLES, 1),
+    (server.YAMNET_FRAME_SAMPLES + server.YAMNET_HOP_SAMPLES - 1, 1),
+    (server.YAMNET_FRAME_SAMPLES + server.YAMNET_HOP_SAMPLES, 2),
+    (server.YAMNET_FRAME_SAMPLES + 3 * server.YAMNET_HOP_SAMPLES, 4),
+])
+def test_frame_yamnet_input_frame_count(n_samples, n_frames):
+    y = np.arange(n_samples, dtype=np.float32)
+    framed = server.frame_yamnet_input(y)
+
+    assert framed.shape == (n_frames, server.YAMNET_FRAME_SAMPLES)
+    assert framed[-1, 0] == (n_frames - 1) * server.YAMNET_HOP_SAMPLES
+
+
+class FakeTracks:
+    def __init__(self, cached=None):
+        self.cached = cached
+        self.lookups = []
+
+    async def find_one(self, query, projection=None, sort=None):
+        self.lookups.append((query, sort))
+        return self.cached
+
+
+class FakeUpload:
+    def __init__(self, data, filename='loop.wav'):
+        self.data = data
+        self.filename = filename
+
+    async def read(self, size=-1):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+CACHED_TRACK = {
+    'id': 'old-id',
+    'user_id': 'someone-else',
+    'filename': 'original.wav',
+    'bpm': 128.0,
+    'key': 'A minor',
+    'instruments': [{'name': 'Piano', 'confidence': 0.9}],
+    'mood_tags': ['energetic'],
+    'duration': 4.0,
+}
+
+
+def analyze_upload(monkeypatch, cached, use_yamnet):
+    tracks = FakeTracks(cached)
+    calls = []
+
+    async def fake_run_dsp(tmp_path, want_16k):
+        calls.append('dsp')
+        return {'bpm': 90.0, 'key': 'C major', 'mood_tags': ['calm'], 'duration': 2.0, 'y16k': None}
+
+    async def fake_detect_instruments(y16k):
+        calls.append('yamnet')
+        return [{'name': 'Guitar', 'confidence': 0.8}]
+
+    monkeypatch.setattr(server, 'db', type('FakeDb', (), {'tracks': tracks})())
+    monkeypatch.setattr(server, 'run_dsp', fake_run_dsp)
+    monkeypatch.setattr(server, 'detect_instruments', fake_detect_instruments)
+    metadata = asyncio.run(server.analyze_single_file(FakeUpload(b'RIFF audio'), use_yamnet))
+    return metadata, tracks, calls
+
+
+def test_analyze_reuses_cached_analysis_across_users(monkeypatch):
+    metadata, tracks, calls = analyze_upload(monkeypatch, dict(CACHED_TRACK), use_yamnet=True)
+
+    content_hash = server.hashlib.sha256(b'RIFF audio').hexdigest()
+    assert tracks.lookups == [({'content_hash': content_hash}, server.TRACK_SORT)]
+    assert calls == []
+    assert metadata.id != 'old-id'
+    assert metadata.filename == 'loop.wav'
+    assert metadata.bpm == 128.0
+    assert metadata.key == 'A minor'
+    assert metadata.instruments == CACHED_TRACK['instruments']
+    assert metadata.file_size == len(b'RIFF audio')
+    assert metadata.content_hash == content_hash
+
+
+def test_analyze_runs_dsp_on_cache_miss(monkeypatch):
+    metadata, _, calls = analyze_upload(monkeypatch, None, use_yamnet=True)
+
+    assert calls == ['dsp', 'yamnet']
+    assert metadata.bpm == 90.0
+    assert metadata.instruments == [{'name': 'Guitar', 'confidence': 0.8}]
+
+
+def test_analyze_reanalyzes_cached_entry_without_instruments(monkeypatch):
+    cached = dict(CACHED_TRACK, instruments=[])
+    metadata, _, calls = analyze_upload(monkeypatch, cached, use_yamnet=True)
+
+    assert calls == ['dsp', 'yamnet']
+    assert metadata.instruments == [{'name': 'Guitar', 'confidence': 0.8}]
+
+
+def test_analyze_without_yamnet_reuses_cache_and_drops_instruments(monkeypatch):
+    metadata, _, calls = analyze_upload(monkeypatch, dict(CACHED_TRACK), use_yamnet=False)
+
+    assert calls == []
+    assert metadata.bpm == 128.0
+    assert metadata.instruments == []
+
+
+def test_analyze_without_yamnet_reuses_cached_entry_without_instruments(monkeypatch):
+    cached = dict(CACHED_TRACK, instruments=[])
+    metadata, _, calls = analyze_upload(monkeypatch, cached, use_yamnet=False)
+
+    assert calls == []
+    assert metadata.instruments == []